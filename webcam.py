@@ -1,20 +1,36 @@
 #!/usr/bin/env python3
 import cv2
-from http.server import BaseHTTPRequestHandler, HTTPServer
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import time
 import subprocess
+import functools
 import re
 import urllib.parse
 import threading
 import queue
 
+# Optional libjpeg-turbo encoder - much faster than cv2.imencode when available
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420, TJFLAG_FASTDCT
+    _tj = TurboJPEG()
+except (ImportError, OSError):
+    _tj = None
+
+# Optional NVIDIA GPU JPEG encoder - only worth the host/device transfer for
+# large frames, so _encode_frame gates it on frame area
+try:
+    from nvjpeg import NvJpeg
+    _nvj = NvJpeg()
+except (ImportError, OSError):
+    _nvj = None
+
 # Configuration Variables - Edit these as needed
 SERVER_HOST = '0.0.0.0'  # Use '0.0.0.0' to accept connections from any IP, or set to specific IP
 SERVER_PORT = 8086       # Port number for the web server
 APP_TITLE = 'Webcam Streamer'  # Application title shown in browser
 JPEG_QUALITY = 85        # JPEG compression quality (1-100, higher = better quality)
 DEFAULT_FPS = 30         # Target frames per second
-BUFFER_SIZE = 2          # Frame buffer size (increase if you have frame drops)
 
 class ThreadedWebcamStreamer:
     def __init__(self, camera_id=0):
@@ -26,9 +42,14 @@ class ThreadedWebcamStreamer:
         self.max_fps = DEFAULT_FPS
         self.available_resolutions = []
         
-        self.frame_queue = queue.Queue(maxsize=BUFFER_SIZE)
-        self.current_frame = None
+        self._latest_jpeg = None
+        self._passthrough = False
+        self._tj_comp = None
+        self._frame_cv = threading.Condition()
+        self._frame_id = 0
+        self._encode_queue = queue.Queue(maxsize=1)
         self.capture_thread = None
+        self.encode_thread = None
         self.running = False
         
         self.open_camera()
@@ -37,17 +58,13 @@ class ThreadedWebcamStreamer:
     def detect_camera_capabilities(self):
         if not self.cap or not self.cap.isOpened():
             return
-        
-        fps_to_test = [60, 45, 36, 30, 25, 20, 15]
-        max_fps = 15
-        
-        for test_fps in fps_to_test:
-            self.cap.set(cv2.CAP_PROP_FPS, test_fps)
-            actual_fps = self.cap.get(cv2.CAP_PROP_FPS)
-            if actual_fps > max_fps:
-                max_fps = actual_fps
-        
-        self.max_fps = int(max_fps)
+
+        # One parsed v4l2-ctl query instead of probing CAP_PROP_FPS values;
+        # each cap.set(CAP_PROP_FPS) can trigger a driver reconfigure
+        rates = get_camera_frame_rates(self.camera_id)
+        all_rates = [fps for fps_list in rates.values() for fps in fps_list]
+
+        self.max_fps = int(max(all_rates)) if all_rates else DEFAULT_FPS
         self.fps = self.max_fps
 
     def open_camera(self):
@@ -60,7 +77,13 @@ class ThreadedWebcamStreamer:
         if self.cap.isOpened():
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-            
+
+            # The camera already delivers JPEG frames with the MJPG fourcc;
+            # ask OpenCV not to decode them so they can be forwarded as-is.
+            # _capture_frames verifies the first frame and falls back to
+            # decode+re-encode if the driver ignores this.
+            self._passthrough = bool(self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+
             self.detect_camera_capabilities()
             self.available_resolutions = get_camera_specs(self.camera_id)
             
@@ -80,33 +103,75 @@ class ThreadedWebcamStreamer:
         self.running = True
         self.capture_thread = threading.Thread(target=self._capture_frames, daemon=True)
         self.capture_thread.start()
+        self.encode_thread = threading.Thread(target=self._encode_worker, daemon=True)
+        self.encode_thread.start()
 
     def stop_capture_thread(self):
         self.running = False
         if self.capture_thread:
             self.capture_thread.join(timeout=2)
+        if self.encode_thread:
+            self.encode_thread.join(timeout=2)
 
     def _capture_frames(self):
         while self.running:
             if self.cap and self.cap.isOpened():
                 ret, frame = self.cap.read()
-                
+
                 if ret:
-                    try:
-                        if self.frame_queue.full():
+                    if self._passthrough:
+                        jpeg = frame.tobytes()
+                        if frame.ndim >= 3 or jpeg[:2] != b'\xff\xd8':
+                            # Not a raw JPEG buffer after all - re-enable
+                            # OpenCV's decode and encode ourselves from now on
+                            self._passthrough = False
+                            self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+                            continue
+                        self._publish_jpeg(jpeg)
+                    else:
+                        # Hand the raw frame to the encoder thread so the
+                        # next cap.read() overlaps the encode; latest wins
+                        # if the encoder hasn't picked up the previous one
+                        if self._encode_queue.full():
                             try:
-                                self.frame_queue.get_nowait()
+                                self._encode_queue.get_nowait()
                             except queue.Empty:
                                 pass
-                        
-                        self.frame_queue.put(frame, block=False)
-                    except queue.Full:
-                        pass
-                
-                time.sleep(1.0 / self.fps)
+                        try:
+                            self._encode_queue.put_nowait(frame)
+                        except queue.Full:
+                            pass
             else:
                 time.sleep(0.1)
 
+    def _encode_worker(self):
+        while self.running:
+            try:
+                frame = self._encode_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._publish_jpeg(self._encode_frame(frame))
+
+    def _publish_jpeg(self, jpeg):
+        with self._frame_cv:
+            self._latest_jpeg = jpeg
+            self._frame_id += 1
+            self._frame_cv.notify_all()
+
+    def _encode_frame(self, frame):
+        if _nvj is not None and self.width * self.height > 1_000_000:
+            return _nvj.encode(frame, JPEG_QUALITY)
+        tj = self._tj_comp or _tj
+        if tj is not None:
+            return tj.encode(frame, quality=JPEG_QUALITY,
+                             pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420,
+                             flags=TJFLAG_FASTDCT)
+        _, buffer = cv2.imencode('.jpg', frame, [
+            cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+            cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420
+        ])
+        return buffer.tobytes()
+
     def set_resolution(self, width, height):
         if self.cap:
             self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
@@ -120,87 +185,137 @@ class ThreadedWebcamStreamer:
             self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
             self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
+            if _tj is not None:
+                # Dedicated compressor for this frame size, warmed with one
+                # dummy encode so its internal buffers are allocated before
+                # the first real frame
+                comp = TurboJPEG()
+                comp.encode(np.zeros((self.height, self.width, 3), np.uint8),
+                            quality=JPEG_QUALITY, pixel_format=TJPF_BGR,
+                            jpeg_subsample=TJSAMP_420, flags=TJFLAG_FASTDCT)
+                self._tj_comp = comp
+
     def switch_camera(self, camera_id):
         print(f"Switching from camera {self.camera_id} to {camera_id}")
         self.stop_capture_thread()
         self.camera_id = camera_id
-        
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                break
-        
-        self.current_frame = None
+
+        self._latest_jpeg = None
         self.open_camera()
         self.start_capture_thread()
         print(f"Camera switch to {camera_id} complete")
         return True
 
     def get_frame(self):
-        try:
-            frame = self.frame_queue.get_nowait()
-            self.current_frame = frame
-        except queue.Empty:
-            frame = self.current_frame
-            
-        if frame is not None:
-            _, buffer = cv2.imencode('.jpg', frame, [
-                cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
-                cv2.IMWRITE_JPEG_OPTIMIZE, 1
-            ])
-            return buffer.tobytes()
-        return None
+        # Reading the slot is a single attribute load, atomic under the GIL;
+        # no lock needed on the consumer side
+        return self._latest_jpeg
+
+# One combined pattern per v4l2-ctl output: device-name lines start flush
+# left, device nodes are tab-indented; format names and discrete sizes
+# interleave in --list-formats-ext output. A single finditer pass replaces
+# the per-line startswith/in/search loops.
+_DEVICE_RE = re.compile(r'^(\S[^\n]*)$|^\t(/dev/video(\d+))', re.M)
+_SPEC_RE = re.compile(r'(MJPG|YUYV)|Size: Discrete\s+(\d+)x(\d+)|\(([\d.]+) fps\)')
 
 def get_available_cameras():
     cameras = {}
-    
+
     try:
-        result = subprocess.run(['v4l2-ctl', '--list-devices'], 
+        result = subprocess.run(['v4l2-ctl', '--list-devices'],
                               capture_output=True, text=True)
-        
+
         current_device = None
-        for line in result.stdout.split('\n'):
-            if line and not line.startswith('\t'):
-                current_device = line.strip()
-            elif line.startswith('\t/dev/video'):
-                device_path = line.strip()
-                device_num = int(re.search(r'/dev/video(\d+)', device_path).group(1))
+        for match in _DEVICE_RE.finditer(result.stdout):
+            if match.group(1):
+                current_device = match.group(1).strip()
+            else:
+                device_num = int(match.group(3))
                 if device_num % 2 == 0:
                     cameras[device_num] = {
                         'name': current_device,
-                        'path': device_path
+                        'path': match.group(2)
                     }
     except:
         pass
-    
+
     return cameras
 
-def get_camera_specs(device_num):
+@functools.lru_cache(maxsize=None)
+def _list_formats(device_num):
     try:
-        result = subprocess.run(['v4l2-ctl', f'--device=/dev/video{device_num}', '--list-formats-ext'], 
+        result = subprocess.run(['v4l2-ctl', f'--device=/dev/video{device_num}', '--list-formats-ext'],
                               capture_output=True, text=True)
-        
-        resolutions = []
-        current_format = None
-        
-        for line in result.stdout.split('\n'):
-            if 'MJPG' in line or 'YUYV' in line:
-                current_format = 'MJPG' if 'MJPG' in line else 'YUYV'
-            elif 'Size: Discrete' in line and current_format:
-                size_match = re.search(r'(\d+)x(\d+)', line)
-                if size_match:
-                    width, height = int(size_match.group(1)), int(size_match.group(2))
-                    if (width, height) not in resolutions:
-                        resolutions.append((width, height))
-        
-        resolutions.sort(key=lambda x: x[0] * x[1], reverse=True)
-        return resolutions
+        return result.stdout
     except:
+        return ''
+
+def get_camera_specs(device_num):
+    output = _list_formats(device_num)
+    if not output:
         return [(1280, 720), (640, 480)]
 
-def find_best_camera():
-    cameras = get_available_cameras()
+    resolutions = []
+    current_format = None
+
+    for match in _SPEC_RE.finditer(output):
+        if match.group(1):
+            current_format = match.group(1)
+        elif match.group(2) and current_format:
+            width, height = int(match.group(2)), int(match.group(3))
+            if (width, height) not in resolutions:
+                resolutions.append((width, height))
+
+    resolutions.sort(key=lambda x: x[0] * x[1], reverse=True)
+    return resolutions
+
+def get_camera_frame_rates(device_num):
+    rates = {}
+    current_format = None
+    current_size = None
+
+    for match in _SPEC_RE.finditer(_list_formats(device_num)):
+        if match.group(1):
+            current_format = match.group(1)
+            current_size = None
+        elif match.group(2):
+            current_size = (int(match.group(2)), int(match.group(3))) if current_format else None
+        elif match.group(4) and current_size:
+            fps = float(match.group(4))
+            rates.setdefault(current_size, [])
+            if fps not in rates[current_size]:
+                rates[current_size].append(fps)
+
+    return rates
+
+def enable_opencl():
+    # Opt in to OpenCV's transparent API so per-pixel work in the decode and
+    # encode fallback paths can run on an iGPU when an OpenCL runtime exists.
+    # Feeding imencode a pre-converted YCrCb frame would make it convert
+    # again, so device offload stays inside cv2's own dispatch.
+    if cv2.ocl.haveOpenCL():
+        cv2.ocl.setUseOpenCL(True)
+        device = cv2.ocl.Device.getDefault()
+        print(f'OpenCL enabled: {device.name()}')
+
+def check_jpeg_backend():
+    # Some OpenCV wheels ship libjpeg-turbo with SIMD disabled, which makes
+    # cv2.imencode run at scalar-libjpeg speed. Irrelevant while the
+    # TurboJPEG fallback is loaded, but worth a loud warning otherwise.
+    if _tj is not None:
+        return
+
+    info = cv2.getBuildInformation()
+    jpeg_lines = [line.strip() for line in info.splitlines() if 'JPEG' in line]
+
+    if not any('libjpeg-turbo' in line for line in jpeg_lines):
+        print('Warning: this OpenCV build does not use libjpeg-turbo, so JPEG')
+        print('encoding may be several times slower than it should be.')
+        print('Install PyTurboJPEG and the system libturbojpeg to fix this.')
+        for line in jpeg_lines:
+            print(f'  {line}')
+
+def find_best_camera(cameras):
     if not cameras:
         return 0
     
@@ -217,30 +332,10 @@ def find_best_camera():
     
     return best_camera if best_camera is not None else list(cameras.keys())[0]
 
-# Global variables
-cameras = get_available_cameras()
-current_camera = find_best_camera()
-streamer = ThreadedWebcamStreamer(current_camera)
-
-class StreamHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        pass
-        
-    def do_GET(self):
-        global current_camera, streamer, cameras
-        
-        if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            
-            camera_options = ""
-            for cam_id, cam_info in cameras.items():
-                # Fix dropdown selection - use current_camera instead of streamer.camera_id
-                selected = "selected" if cam_id == current_camera else ""
-                camera_options += f'<option value="{cam_id}" {selected}>{cam_info["name"]}</option>'
-            
-            html = f'''<!DOCTYPE html>
+# The index page is ~6 KB of HTML with only two small dynamic regions (the
+# camera <select> options and the stats line). Encode the static parts once
+# at import time so GET / only formats and encodes the dynamic bytes.
+_HTML_TEMPLATE = f'''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -433,13 +528,13 @@ class StreamHandler(BaseHTTPRequestHandler):
             <div class="control-group">
                 <label for="cameraSelect">Camera:</label>
                 <select id="cameraSelect" onchange="switchCamera()">
-                    {camera_options}
+                    @CAMERA_OPTIONS@
                 </select>
             </div>
         </div>
         
         <div class="stats">
-            <strong>Current:</strong> {streamer.width} × {streamer.height} • {streamer.fps} FPS • Quality {JPEG_QUALITY}% • Camera {current_camera}
+            <strong>Current:</strong> @STATS@
         </div>
         
         <div class="video-wrapper">
@@ -481,18 +576,10 @@ class StreamHandler(BaseHTTPRequestHandler):
         }}
         
         function saveSnapshot() {{
-            const img = document.getElementById('stream');
-            const canvas = document.createElement('canvas');
-            canvas.width = img.naturalWidth;
-            canvas.height = img.naturalHeight;
-            
-            const ctx = canvas.getContext('2d');
-            ctx.drawImage(img, 0, 0);
-            
             const link = document.createElement('a');
             const cam = document.getElementById('cameraSelect').selectedOptions[0].text.replace(/[^a-zA-Z0-9]/g, '_');
             link.download = cam + '_' + new Date().toISOString().slice(0,19).replace(/:/g, '-') + '.jpg';
-            link.href = canvas.toDataURL('image/jpeg', 1.0);
+            link.href = '/snapshot.jpg?' + Date.now();
             link.click();
         }}
         
@@ -519,8 +606,62 @@ class StreamHandler(BaseHTTPRequestHandler):
     </script>
 </body>
 </html>'''
-            
-            self.wfile.write(html.encode('utf-8'))
+
+_head, _rest = _HTML_TEMPLATE.split('@CAMERA_OPTIONS@')
+_mid, _tail = _rest.split('@STATS@')
+HTML_HEAD_BYTES = _head.encode('utf-8')
+HTML_MID_BYTES = _mid.encode('utf-8')
+HTML_TAIL_BYTES = _tail.encode('utf-8')
+
+# Global variables
+cameras = get_available_cameras()
+current_camera = find_best_camera(cameras)
+streamer = ThreadedWebcamStreamer(current_camera)
+
+# Static parts of the multipart framing, built once. Only the small header
+# is assembled per frame (into a bytearray each connection reuses); the JPEG
+# payload itself goes to the socket via scatter-gather without being copied
+# into an intermediate buffer.
+_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+_PART_TRAILER = b'\r\n'
+
+def _fill_part_header(buf, length):
+    buf.clear()
+    buf += _PART_HEADER
+    buf += b'%d\r\n\r\n' % length
+
+def _send_part(sock, header, jpeg):
+    total = len(header) + len(jpeg) + len(_PART_TRAILER)
+    sent = sock.sendmsg((header, jpeg, _PART_TRAILER))
+    if sent < total:
+        # Rare short write; finish the part with a plain sendall
+        sock.sendall(b''.join((header, jpeg, _PART_TRAILER))[sent:])
+
+class StreamHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+        
+    def do_GET(self):
+        global current_camera, streamer, cameras
+        
+        if self.path == '/':
+            camera_options = ""
+            for cam_id, cam_info in cameras.items():
+                # Fix dropdown selection - use current_camera instead of streamer.camera_id
+                selected = "selected" if cam_id == current_camera else ""
+                camera_options += f'<option value="{cam_id}" {selected}>{cam_info["name"]}</option>'
+
+            stats = (f'{streamer.width} × {streamer.height} • {streamer.fps} FPS'
+                     f' • Quality {JPEG_QUALITY}% • Camera {current_camera}')
+
+            body = (HTML_HEAD_BYTES + camera_options.encode('utf-8')
+                    + HTML_MID_BYTES + stats.encode('utf-8') + HTML_TAIL_BYTES)
+
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
             
         elif self.path.startswith('/api/camera') and 'id=' in self.path:
             query = urllib.parse.urlparse(self.path).query
@@ -536,25 +677,38 @@ class StreamHandler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(b'OK')
             
+        elif self.path.startswith('/snapshot.jpg'):
+            # Serve the camera's own JPEG bytes - no decode or re-encode,
+            # and no lossy canvas round-trip in the browser
+            frame_data = streamer.get_frame()
+            if frame_data:
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(frame_data)))
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                self.wfile.write(frame_data)
+            else:
+                self.send_error(503)
+
         elif self.path == '/stream.mjpg':
             self.send_response(200)
             self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
             self.send_header('Cache-Control', 'no-cache')
-            self.send_header('Connection', 'close')
             self.end_headers()
             
             try:
+                last_id = -1
+                part_buf = bytearray()
                 while True:
+                    with streamer._frame_cv:
+                        streamer._frame_cv.wait_for(
+                            lambda: streamer._frame_id != last_id, timeout=1.0)
+                        last_id = streamer._frame_id
                     frame_data = streamer.get_frame()
                     if frame_data:
-                        self.wfile.write(b'--frame\r\n')
-                        self.send_header('Content-Type', 'image/jpeg')
-                        self.send_header('Content-Length', str(len(frame_data)))
-                        self.end_headers()
-                        self.wfile.write(frame_data)
-                        self.wfile.write(b'\r\n')
-                        self.wfile.flush()
-                    time.sleep(0.033)
+                        _fill_part_header(part_buf, len(frame_data))
+                        _send_part(self.connection, part_buf, frame_data)
             except (ConnectionResetError, BrokenPipeError):
                 pass
             except Exception as e:
@@ -563,6 +717,9 @@ class StreamHandler(BaseHTTPRequestHandler):
             self.send_error(404)
 
 if __name__ == '__main__':
+    enable_opencl()
+    check_jpeg_backend()
+
     print('Available cameras:')
     for cam_id, cam_info in cameras.items():
         print(f"  {cam_id}: {cam_info['name']}")
@@ -572,7 +729,7 @@ if __name__ == '__main__':
     print(f'Access from browser at: http://localhost:{SERVER_PORT}/')
     
     try:
-        server = HTTPServer((SERVER_HOST, SERVER_PORT), StreamHandler)
+        server = ThreadingHTTPServer((SERVER_HOST, SERVER_PORT), StreamHandler)
         server.serve_forever()
     except KeyboardInterrupt:
         print('\nShutting down...')